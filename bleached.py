@@ -1,4 +1,5 @@
 import re
+import sys
 
 
 __version__ = '1.0.0'
@@ -16,10 +17,10 @@ required.
 
 Other elements cannot use the ending slash syntax (ex: "<h1/>").
 """
-VOID_ELEMENTS = {
+VOID_ELEMENTS = frozenset(map(sys.intern, {
     'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
     'source', 'track', 'wbr',
-}
+}))
 
 ELEMENT_CHARS = (
     'abcdefghijklmnopqrstuvwxyz' +
@@ -31,6 +32,28 @@ ELEMENT_CHARS = set(ELEMENT_CHARS)
 
 ATTRIBUTE_CHARS = ELEMENT_CHARS
 
+
+def _char_class(chars):
+    """Builds a regular expression character class from a set of characters.
+    """
+    return '[%s]' % re.escape(''.join(sorted(chars)))
+
+
+_WHITESPACE_RE = re.compile(_char_class(WHITESPACE) + '*')
+
+_TAG_START_RE = re.compile(
+    '<{ws}*(/?){ws}*({name}*)'.format(
+        ws=_char_class(WHITESPACE),
+        name=_char_class(ELEMENT_CHARS),
+    ),
+)
+
+_ATTRIBUTE_NAME_RE = re.compile(_char_class(ATTRIBUTE_CHARS) + '*')
+
+_ENTITY_RE = re.compile(r'&([^;]{0,10})(;?)')
+
+_STRUCTURAL_RE = re.compile(r'[<>&]')
+
 HTML_ENTITIES = {
     'nbsp': '\x20',
     'quot': '"',
@@ -40,7 +63,7 @@ HTML_ENTITIES = {
     'gt': '>',
 }
 
-DEFAULT_TAGS = {
+DEFAULT_TAGS = frozenset(map(sys.intern, {
     'p', 'br', 'code', 'blockquote', 'pre',  # formatting
     'sub', 'sup', 'caption',
     'a', 'img',  # non-text
@@ -49,28 +72,22 @@ DEFAULT_TAGS = {
     'ul', 'ol', 'li', 'dl', 'dt', 'dd',  # lists
     'table', 'thead', 'tbody', 'tr', 'th', 'td',  # tables
     'colgroup', 'col',  # columns
-}
+}))
 
 DEFAULT_ATTRIBUTES = {
-    'a': {'href', 'title'},
-    'img': {'src', 'width', 'height'},
+    sys.intern('a'): frozenset({'href', 'title'}),
+    sys.intern('img'): frozenset({'src', 'width', 'height'}),
 }
 
 
-class EndOfInput(ValueError):
-    pass
-
-
 class UnsafeInput(ValueError):
-    def __init__(self, message, index, line, line_position):
-        full_message = "Line %d character %d (input index %d): %s" % (
-            line,
-            line_position,
-            index,
-            message,
+    def __init__(self, message, index, line, line_position, *message_args):
+        ValueError.__init__(
+            self, message, index, line, line_position, *message_args
         )
-        super(ValueError, self).__init__(full_message)
-        self.message = message
+        """Message, formatted with `message_args` when reading `message`."""
+        self.message_template = message
+        self.message_args = message_args
         """Index in the string, 0-based."""
         self.index = index
         """Line number, 1-based."""
@@ -78,149 +95,157 @@ class UnsafeInput(ValueError):
         """Character number in the line, 1-based."""
         self.line_position = line_position
 
+    @property
+    def message(self):
+        if self.message_args:
+            return self.message_template % self.message_args
+        return self.message_template
+
+    def __str__(self):
+        return "Line %d character %d (input index %d): %s" % (
+            self.line,
+            self.line_position,
+            self.index,
+            self.message,
+        )
+
 
 def check_html(
     source,
-    *,
     tags=DEFAULT_TAGS,
     attributes=DEFAULT_ATTRIBUTES,
 ):
-    Checker(source, tags=tags, attributes=attributes).check()
+    Checker(source, tags, attributes).check()
 
 
 def is_html_bleached(
     source,
-    *,
     tags=DEFAULT_TAGS,
     attributes=DEFAULT_ATTRIBUTES,
 ):
     try:
-        check_html(source, tags=tags, attributes=attributes)
+        check_html(source, tags, attributes)
         return True
     except UnsafeInput:
         return False
 
 
 class Checker(object):
-    def __init__(self, source, *, tags, attributes):
+    __slots__ = (
+        'source', 'source_length', 'tags', 'attributes',
+        'tag_names', 'tag_ids',
+        'position', 'element_stack',
+    )
+
+    def __init__(self, source, tags, attributes):
         self.source = source
+        self.source_length = len(source)
         self.tags = tags
         self.attributes = attributes
+        # Numbers for the tags seen so far, used on the element stack
+        self.tag_names = []
+        self.tag_ids = {}
         self.position = 0
-        self.line = 1
-        self.line_position = 1
         self.element_stack = []
 
     def consume_char(self):
         c = self.peek_char()
+        if not c:
+            self.fail("Unexpected end of input")
         self.position += 1
-        if c == '\n':
-            self.line_position = 1
-            self.line += 1
-        else:
-            self.line_position += 1
         return c
 
     def peek_char(self):
-        if self.position >= len(self.source):
-            raise EndOfInput
-        return self.source[self.position:self.position + 1]
+        """Returns the next character, or '' at the end of the input.
+        """
+        if self.position >= self.source_length:
+            return ''
+        return self.source[self.position]
+
+    def read_attribute_name(self):
+        """Reads an attribute name, made of `ATTRIBUTE_CHARS`.
+        """
+        m = _ATTRIBUTE_NAME_RE.match(self.source, self.position)
+        self.position = m.end()
+        return m.group()
 
     def skip_whitespace(self):
-        while self.peek_char() in WHITESPACE:
-            self.consume_char()
+        self.position = _WHITESPACE_RE.match(self.source, self.position).end()
 
     def check(self):
-        try:
-            while True:
-                try:
-                    c = self.peek_char()
-                except EndOfInput:
-                    break
-                if c == '>':
-                    self.fail("Unexpected '>' character")
-                elif c == '<':
-                    what, tag_name = self.read_tag()
-                    if what == 'open':
-                        if tag_name not in VOID_ELEMENTS:
-                            self.element_stack.append(tag_name)
-                            if len(self.element_stack) >= 1000:
-                                self.fail("Element stack too deep")
-                    elif what == 'close':
-                        if self.element_stack and tag_name == self.element_stack[-1]:
-                            self.element_stack.pop(-1)
-                        else:
-                            self.fail(
-                                "Closing tag for wrong element %r" % tag_name,
-                            )
-                    else:
-                        if tag_name not in VOID_ELEMENTS:
-                            self.fail(
-                                "Self-closing tag for non-void element %r" % (
-                                    tag_name,
-                                ),
-                            )
-                elif c == '&':
-                    self.read_entity()
+        # Local aliases, this loop runs once per tag, entity, or text run
+        source = self.source
+        source_length = self.source_length
+        find_structural = _STRUCTURAL_RE.search
+        while self.position < source_length:
+            c = source[self.position]
+            if c == '>':
+                self.fail("Unexpected '>' character")
+            elif c == '<':
+                self.read_tag()
+            elif c == '&':
+                self.read_entity()
+            else:
+                # Skip text up to the next structural character
+                # This works on the str directly: CPython stores ASCII text
+                # one byte per character already, so encoding to bytes
+                # would only add a copy
+                m = find_structural(source, self.position)
+                if m is not None:
+                    self.position = m.start()
                 else:
-                    self.consume_char()
-        except EndOfInput:
-            self.fail("Unexpected end of input")
+                    self.position = source_length
 
         if self.element_stack:
             self.fail(
-                "Missing closing tag for element %r" % self.element_stack[-1],
+                "Missing closing tag for element %r",
+                self.tag_names[self.element_stack[-1]],
             )
 
     def read_entity(self):
         """Reads an HTML entity, e.g. "&nbsp;".
         """
-        assert self.consume_char() == '&'
-        entity = []
-        while True:
-            c = self.consume_char()
-            if c == ';':
-                break
-            elif len(entity) >= 10:
-                self.fail("Entity too long")
-            else:
-                entity.append(c)
-        entity = ''.join(entity).lower()
+        m = _ENTITY_RE.match(self.source, self.position)
+        if not m.group(2):
+            if m.end() >= self.source_length:
+                self.position = self.source_length
+                self.fail("Unexpected end of input")
+            self.position = m.end() + 1
+            self.fail("Entity too long")
+        self.position = m.end()
+        entity = m.group(1).lower()
         if entity and entity[0] == '#':
-            if not re.match('^#[0-9]+$', entity):
+            digits = entity[1:]
+            # Not str.isdigit(), which accepts non-ASCII digits
+            if not digits or digits.strip('0123456789'):
                 self.fail("Invalid numerical entity")
         else:
             if entity not in HTML_ENTITIES:
-                self.fail("Unknown HTML entity %r" % entity)
-        return HTML_ENTITIES[entity]
+                self.fail("Unknown HTML entity %r", entity)
 
     def read_tag(self):
         """Reads an HTML tag, e.g. either "<h1>" or "</h1>".
 
         This always assumes that tags are terminated, so "<br>" won't
         be accepted.
+
+        The element stack is updated for the tag that was read.
         """
-        assert self.consume_char() == '<'
-        self.skip_whitespace()
-        if self.peek_char() == '/':
-            closing = True
-            self.consume_char()
-            self.skip_whitespace()
-        else:
-            closing = False
-        tag_name = []
-        while True:
-            c = self.peek_char()
-            if c in WHITESPACE or c == '/' or c == '>':
-                break
-            elif c in ELEMENT_CHARS:
-                tag_name.append(self.consume_char())
-            else:
-                self.fail("Unexpected character in tag name")
+        # Read up to the end of the tag name in one go
+        m = _TAG_START_RE.match(self.source, self.position)
+        self.position = m.end()
+        closing = bool(m.group(1))
+        tag_name = m.group(2)
+        if not tag_name.islower():
+            tag_name = tag_name.lower()
+        c = self.peek_char()
+        if not c:
+            self.fail("Unexpected end of input")
+        elif c not in WHITESPACE and c != '/' and c != '>':
+            self.fail("Unexpected character in tag name")
 
-        tag_name = ''.join(tag_name).lower()
         if tag_name not in self.tags:
-            self.fail("Found forbidden opening tag %r" % tag_name)
+            self.fail("Found forbidden opening tag %r", tag_name)
 
         if not closing:
             self.read_attributes(tag_name)
@@ -228,10 +253,23 @@ class Checker(object):
         self.skip_whitespace()
         c = self.consume_char()
         if c == '>':
+            element_stack = self.element_stack
             if closing:
-                return 'close', tag_name
-            else:
-                return 'open', tag_name
+                if (
+                    element_stack and
+                    self.tag_ids.get(tag_name) == element_stack[-1]
+                ):
+                    element_stack.pop(-1)
+                else:
+                    self.fail("Closing tag for wrong element %r", tag_name)
+            elif tag_name not in VOID_ELEMENTS:
+                tag_id = self.tag_ids.get(tag_name)
+                if tag_id is None:
+                    tag_id = self.tag_ids[tag_name] = len(self.tag_names)
+                    self.tag_names.append(tag_name)
+                element_stack.append(tag_id)
+                if len(element_stack) >= 1000:
+                    self.fail("Element stack too deep")
         elif c == '/':
             if closing:
                 self.fail("Saw tag with slashes on both sides")
@@ -239,63 +277,91 @@ class Checker(object):
                 self.skip_whitespace()
                 if self.consume_char() != '>':
                     self.fail("Missing tag close after ending slash")
-                return 'selfclose', tag_name
+                if tag_name not in VOID_ELEMENTS:
+                    self.fail(
+                        "Self-closing tag for non-void element %r",
+                        tag_name,
+                    )
         else:
             self.fail("Unexpected character in tag")
 
     def read_attributes(self, tag_name):
         """Reads the attributes of an HTML tag.
         """
+        allowed = self.attributes.get(tag_name, ())
+        find = self.source.find
+
         while True:
             self.skip_whitespace()
 
-            if self.peek_char() in '>/':
+            c = self.peek_char()
+            if c == '>' or c == '/':
                 break
 
             # Read name
-            attribute_name = []
-            while True:
-                c = self.peek_char()
-                if c in WHITESPACE or c == '/' or c == '>' or c == '=':
-                    break
-                elif c in ATTRIBUTE_CHARS:
-                    attribute_name.append(self.consume_char())
-                else:
-                    self.fail("Unexpected character in attribute")
-            attribute_name = ''.join(attribute_name).lower()
-
-            if attribute_name not in self.attributes.get(tag_name, ()):
-                self.fail("Forbidden attribute %r in tag %r" % (
+            attribute_name = self.read_attribute_name()
+            if not attribute_name.islower():
+                attribute_name = attribute_name.lower()
+            c = self.peek_char()
+            if not c:
+                self.fail("Unexpected end of input")
+            elif c not in WHITESPACE and c != '/' and c != '>' and c != '=':
+                self.fail("Unexpected character in attribute")
+
+            if attribute_name not in allowed:
+                self.fail(
+                    "Forbidden attribute %r in tag %r",
                     attribute_name,
                     tag_name,
-                ))
+                )
 
             self.skip_whitespace()
             c = self.consume_char()
             if c != '=':
-                self.fail("Unexpected character %r in attribute" % c)
+                self.fail("Unexpected character %r in attribute", c)
             self.skip_whitespace()
             quote = self.consume_char()
             if quote != '"' and quote != "'":
                 self.fail("Missing quote for attribute value")
 
-            # Read value
+            # Read value, one run between entities at a time
+            end = -1
             while True:
-                c = self.peek_char()
-                if c == quote:
-                    self.consume_char()
-                    break
-                elif c in '<>':
+                position = self.position
+                if end < position:
+                    # Find the closing quote, again if an entity went past it
+                    end = find(quote, position)
+                    if end == -1:
+                        end = self.source_length
+                entity = find('&', position, end)
+                stop = end if entity == -1 else entity
+                forbidden = find('<', position, stop)
+                if forbidden == -1:
+                    forbidden = stop
+                forbidden_gt = find('>', position, forbidden)
+                if forbidden_gt != -1:
+                    forbidden = forbidden_gt
+                if forbidden != stop:
+                    self.position = forbidden
                     self.fail("Forbidden character in attribute value")
-                elif c == '&':
+                self.position = stop
+                if entity != -1:
                     self.read_entity()
+                elif end == self.source_length:
+                    self.fail("Unexpected end of input")
                 else:
-                    self.consume_char()
+                    self.position += 1
+                    break
 
-    def fail(self, message):
+    def fail(self, message, *args):
+        # Line information is only computed here, on error
+        position = self.position
+        line = self.source.count('\n', 0, position) + 1
+        line_position = position - self.source.rfind('\n', 0, position)
         raise UnsafeInput(
             message,
-            self.position,
-            self.line,
-            self.line_position,
+            position,
+            line,
+            line_position,
+            *args
         )
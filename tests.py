@@ -38,6 +38,67 @@ class TestBleached(unittest.TestCase):
             8, 2, 5,
         )
 
+        self.bad(
+            '<p>Hello\nworld\n</b></p>',
+            "Closing tag for wrong element 'b'",
+            19, 3, 5,
+        )
+
+        self.bad(
+            '<p>\n<b!>x</b></p>',
+            "Unexpected character in tag name",
+            6, 2, 3,
+        )
+        self.bad(
+            '<a hr\xe9f="x">hello</a>',
+            "Unexpected character in attribute",
+            5, 1, 6,
+        )
+
+        self.check('<p>Fish &amp; chips&#33;</p>')
+        self.check('<a title="&quot;hello&quot;">x</a>')
+        self.bad(
+            '<p>&foo;</p>',
+            "Unknown HTML entity 'foo'",
+            8, 1, 9,
+        )
+        self.bad(
+            '<p>&#\u0661\u0662;</p>',
+            "Invalid numerical entity",
+            8, 1, 9,
+        )
+        self.bad(
+            '<p>&#12\n;</p>',
+            "Invalid numerical entity",
+            9, 2, 2,
+        )
+        self.bad(
+            '<p>&abcdefghijkl;</p>',
+            "Entity too long",
+            15, 1, 16,
+        )
+        self.bad(
+            '<p>&abc',
+            "Unexpected end of input",
+            7, 1, 8,
+        )
+
+        self.bad(
+            '<a title="a &amp; b > c">x</a>',
+            "Forbidden character in attribute value",
+            20, 1, 21,
+        )
+        self.bad(
+            '<a title="hello',
+            "Unexpected end of input",
+            15, 1, 16,
+        )
+        self.bad(
+            '<p\n',
+            "Unexpected end of input",
+            3, 2, 1,
+        )
+
         self.check('<p><br/></p>')
         self.check('<p><br></p>')
 
@@ -64,6 +125,18 @@ class TestBleached(unittest.TestCase):
             8, 1, 9,
         )
 
+    def test_policy_changes(self):
+        tags = {'p'}
+        attributes = {}
+        check_html('<p>hello</p>', tags=tags, attributes=attributes)
+        with self.assertRaises(UnsafeInput):
+            check_html('<p class="x">hello</p>', tags=tags,
+                       attributes=attributes)
+        attributes['p'] = {'class'}
+        check_html('<p class="x">hello</p>', tags=tags, attributes=attributes)
+        tags.add('b')
+        check_html('<p><b>hello</b></p>', tags=tags, attributes=attributes)
+
 
 if __name__ == '__main__':
     unittest.main()